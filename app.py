@@ -1,65 +1,152 @@
-import json
 import re
-from collections import deque
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from urllib.parse import urljoin, urlparse, urldefrag
+from urllib.robotparser import RobotFileParser
 import streamlit.components.v1 as components
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
-from bs4 import BeautifulSoup
+import orjson
+from lxml import etree
+from lxml import html as lxml_html
 from pyvis.network import Network
 import tempfile
 import os
 
 UA = "SimpleFlowCrawler/0.1"
+MAX_WORKERS = 32
+MAX_PER_HOST = 8
+
+# Shared session so same-host requests reuse keep-alive connections
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = UA
+# requests already sends Accept-Encoding: gzip, deflate, and adds br when a
+# brotli decoder is installed (see requirements.txt)
+SESSION.headers["Accept"] = "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8"
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+_MULTISLASH = re.compile(r"/{2,}")
+_CSV_ESCAPE = str.maketrans({'"': '""'})
+_ABSOLUTE_PREFIXES = ("http://", "https://", "//")
+_SKIP_PREFIXES = ("mailto:", "tel:", "javascript:", "data:", "#", "about:")
+_UTF8_HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
 
 def normalize_url(base: str, href: str) -> str | None:
-    if href is None:
+    if not href:
         return None
     href = href.strip()
 
-    if href.startswith(("mailto:", "tel:", "javascript:", "data:")):
+    # Fragment-only hrefs point back at the page they appear on
+    if not href or href.startswith(_SKIP_PREFIXES):
         return None
 
+    # Absolute and root-relative hrefs don't depend on the page path, so
+    # key them on less of the base to share cache entries across pages
+    if href.startswith(("http://", "https://")):
+        base = ""
+    elif href.startswith("/") and not href.startswith("//"):
+        base = _origin(base)
+    return _normalize(base, href)
+
+def _origin(url: str) -> str:
+    i = url.find("/", url.find("//") + 2)
+    return url if i < 0 else url[:i]
+
+@lru_cache(maxsize=65536)
+def _normalize(base: str, href: str) -> str | None:
     abs_url = urljoin(base, href)
     abs_url, _ = urldefrag(abs_url)
 
     p = urlparse(abs_url)
-    if p.scheme not in ("http", "https"):
+    scheme = p.scheme
+    if scheme not in ("http", "https"):
         return None
 
     netloc = p.netloc
-    if netloc.endswith(":80") and p.scheme == "http":
+    if netloc.endswith(":80") and scheme == "http":
         netloc = netloc[:-3]
-    if netloc.endswith(":443") and p.scheme == "https":
+    if netloc.endswith(":443") and scheme == "https":
         netloc = netloc[:-4]
 
-    path = re.sub(r"/{2,}", "/", p.path or "/")
-    return p._replace(netloc=netloc, path=path).geturl()
+    path = _MULTISLASH.sub("/", p.path or "/")
+    # One shared string per URL across visited, edges and status_by_url
+    return sys.intern(p._replace(netloc=netloc, path=path).geturl())
 
-def is_internal(url: str, root_netloc: str) -> bool:
+def fetch_html(url: str, timeout: int = 15, method: str = "GET"):
     try:
-        return urlparse(url).netloc == root_netloc
+        if method == "HEAD":
+            r = SESSION.head(url, timeout=timeout, allow_redirects=True)
+            if r.status_code not in (405, 501):
+                return r.status_code, None
+            # HEAD not supported; an unread streamed GET still gives the status
+            with SESSION.get(url, timeout=timeout, allow_redirects=True, stream=True) as r:
+                return r.status_code, None
+
+        # Stream so non-HTML bodies (PDFs, images) are never downloaded
+        with SESSION.get(url, timeout=timeout, allow_redirects=True, stream=True) as r:
+            ct = (r.headers.get("Content-Type") or "").lower()
+            if "text/html" not in ct:
+                return r.status_code, None
+            # requests reports ISO-8859-1 for any text/* without a charset;
+            # only trust the header when it actually names one
+            encoding = r.encoding if "charset=" in ct else "utf-8"
+            try:
+                return r.status_code, r.content.decode(encoding, errors="replace")
+            except LookupError:  # unknown charset name
+                return r.status_code, r.content.decode("utf-8", errors="replace")
     except Exception:
-        return False
+        return None, None
 
-def fetch_html(url: str, timeout: int = 15):
+def fetch_robots(seed: str, timeout: int = 15) -> RobotFileParser:
+    """Fetch and parse robots.txt for the seed's host"""
+    p = urlparse(seed)
+    rp = RobotFileParser(f"{p.scheme}://{p.netloc}/robots.txt")
     try:
-        r = requests.get(url, headers={"User-Agent": UA}, timeout=timeout, allow_redirects=True)
-        ct = (r.headers.get("Content-Type") or "").lower()
-        if "text/html" not in ct:
-            return r.status_code, None
-        return r.status_code, r.text
+        r = SESSION.get(rp.url, headers={"Accept": "text/plain"}, timeout=timeout, allow_redirects=True)
     except Exception:
-        return None, None
+        # Unreachable robots.txt shouldn't block the crawl itself
+        rp.allow_all = True
+        return rp
+
+    # Same status handling as RobotFileParser.read()
+    if r.status_code in (401, 403) or r.status_code >= 500:
+        rp.disallow_all = True
+    elif r.status_code >= 400:
+        rp.allow_all = True
+    else:
+        rp.parse(r.text.splitlines())
+    return rp
 
-def extract_links(page_url: str, html: str) -> set[str]:
-    soup = BeautifulSoup(html, "html.parser")
-    out = set()
-    for a in soup.find_all("a", href=True):
-        u = normalize_url(page_url, a.get("href"))
-        if u:
-            out.add(u)
-    return out
+def extract_links(page_url: str, html: str, root_netloc: str) -> list[str]:
+    try:
+        try:
+            tree = lxml_html.fromstring(html)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration.
+            # fetch_html has already decoded the body, so hand lxml UTF-8 bytes
+            # and override the declared encoding rather than trusting it
+            tree = lxml_html.fromstring(html.encode("utf-8"), parser=_UTF8_HTML_PARSER)
+    except etree.ParserError:
+        return []
+
+    # normalize_url always emits a path, so a trailing "/" keeps
+    # "example.com.evil.org" from matching "example.com"
+    internal_prefixes = (f"http://{root_netloc}/", f"https://{root_netloc}/")
+    # An internal absolute href has root_netloc right after "https://"
+    host_window = len(root_netloc) + len("https://")
+
+    out = {}  # dict keeps document order while deduplicating
+    for h in tree.xpath("//a/@href"):
+        if h.startswith(_ABSOLUTE_PREFIXES) and root_netloc not in h[:host_window]:
+            continue
+        u = normalize_url(page_url, h)
+        if u and u.startswith(internal_prefixes):
+            out[u] = None
+    return list(out)
 
 def get_url_label(url: str, max_length: int = 40) -> str:
     """Create a readable label from URL"""
@@ -464,47 +551,71 @@ def build_network_graph(nodes: list[str], edges: list[tuple[str, str]], status_b
     
     return net
 
-def crawl(seed: str, max_pages: int, max_depth: int):
-    seed = normalize_url(seed, "") or seed
+def crawl(seed: str, max_pages: int, max_depth: int, max_workers: int = MAX_WORKERS, max_per_host: int = MAX_PER_HOST):
+    seed = normalize_url(seed, seed) or seed
     root_netloc = urlparse(seed).netloc
+    # The seed itself is always fetched; robots.txt only gates discovered links
+    robots = fetch_robots(seed)
 
-    q = deque([(seed, 0)])
-    visited = set()
-    edges = set()
+    visited = {}  # URL -> depth, in the order pages were scheduled
+    edges = {}  # source URL -> internal targets in document order
     status_by_url = {}
 
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    while q and len(visited) < max_pages:
-        url, depth = q.popleft()
-        if url in visited:
-            continue
-        visited.add(url)
-        
-        # Update progress
-        progress = len(visited) / max_pages
-        progress_bar.progress(min(progress, 1.0))
-        status_text.text(f"Crawling: {len(visited)} pages found...")
-
-        status, html = fetch_html(url)
-        status_by_url[url] = status
-
-        if not html or depth >= max_depth:
-            continue
-
-        for link in extract_links(url, html):
-            if not is_internal(link, root_netloc):
-                continue
-            edges.add((url, link))
-            if link not in visited:
-                q.append((link, depth + 1))
+    # Only internal URLs are ever fetched, so the per-host cap is also the
+    # overall cap on requests in flight
+    in_flight = max(1, min(max_workers, max_per_host))
+
+    # Crawl in depth waves: every page at depth d is fetched before any page
+    # at d + 1, so each URL is visited at its shortest distance from the seed.
+    # Fetches run in worker threads; all bookkeeping stays on this thread
+    frontier = [seed]
+    depth = 0
+    with ThreadPoolExecutor(max_workers=in_flight) as pool:
+        while frontier and len(visited) < max_pages:
+            wave = frontier[:max_pages - len(visited)]
+            for url in wave:
+                visited[url] = depth
+
+            # Links on max-depth pages are never followed, so only the
+            # status is needed there
+            method = "HEAD" if depth >= max_depth else "GET"
+            futures = {pool.submit(fetch_html, url, method=method): url for url in wave}
+
+            results = {}
+            for fut in as_completed(futures):
+                url = futures[fut]
+                results[url] = fut.result()
+                status_by_url[url] = results[url][0]
+
+                # Update progress
+                progress = len(status_by_url) / max_pages
+                progress_bar.progress(min(progress, 1.0))
+                status_text.text(f"Crawling: {len(status_by_url)} pages found...")
+
+            # Expand pages in frontier order rather than completion order, so
+            # nodes and edges come out the same on every run
+            next_frontier = {}  # dict keeps discovery order while deduplicating
+            for url in wave:
+                html = results[url][1]
+                if html and depth < max_depth:
+                    links = edges[url] = extract_links(url, html, root_netloc)
+                    for link in links:
+                        if link not in visited and link not in next_frontier and robots.can_fetch(UA, link):
+                            next_frontier[link] = None
+
+            frontier = list(next_frontier)
+            depth += 1
 
     progress_bar.empty()
     status_text.empty()
 
-    nodes = sorted(visited)
-    edges_list = sorted(edges)
+    # Crawl order (seed first, then frontier order) instead of sorting; every
+    # edge source is a visited page, so walking nodes covers all edges
+    nodes = list(visited)
+    edges_list = [(a, b) for a in nodes for b in edges.get(a, ())]
     data = {
         "seed": seed,
         "nodes": [{"url": u, "status": status_by_url.get(u)} for u in nodes],
@@ -513,6 +624,16 @@ def crawl(seed: str, max_pages: int, max_depth: int):
     
     return data, nodes, edges_list, status_by_url
 
+def build_csv(nodes: list[dict]) -> str:
+    """Build the crawl.csv export, quoting URLs per RFC 4180"""
+    lines = ["URL,Status,Type"]
+    lines.extend(
+        f'"{node["url"].translate(_CSV_ESCAPE)}",{node.get("status", "N/A")},page'
+        for node in nodes
+    )
+    lines.append("")
+    return "\r\n".join(lines)
+
 def render_network(net: Network):
     """Render the pyvis network in Streamlit"""
     # Save to temporary file
@@ -573,16 +694,13 @@ if run:
     with col1:
         st.download_button(
             "⬇️ Download crawl.json",
-            data=json.dumps(data, indent=2, ensure_ascii=False),
+            data=orjson.dumps(data, option=orjson.OPT_INDENT_2),
             file_name="crawl.json",
             mime="application/json",
             use_container_width=True,
         )
     with col2:
-        # Create CSV export
-        csv_data = "URL,Status,Type\n"
-        for node in data['nodes']:
-            csv_data += f"\"{node['url']}\",{node.get('status', 'N/A')},page\n"
+        csv_data = build_csv(data['nodes'])
         
         st.download_button(
             "⬇️ Download crawl.csv",